@@ -7,6 +7,46 @@ import requests
 import json
 from datetime import datetime
 
+def find_time_fields(root):
+    """
+    一次迭代遍历JSON结构，查找键名包含time的字段以及第一个time.s字段
+
+    访问顺序与原先的两个递归实现一致：time字段按递归打印的顺序收集；
+    time.s在访问到其所在字典时立即检查，先于该字典的子节点。
+    路径以元组形式携带（字典键为str，列表下标为int），仅在命中时才格式化
+
+    Returns:
+        (time字段列表[(路径, 值)], 第一个time.s的(所在time字段路径, 值)或None)
+    """
+    time_fields = []
+    time_s = None
+    stack = [((), root)]
+    while stack:
+        path, obj = stack.pop()
+        # 出栈时检查键名，使每个字段都在其前面兄弟节点的子树之后产出
+        if path and isinstance(path[-1], str) and "time" in path[-1].lower():
+            time_fields.append((format_path(path), obj))
+        if isinstance(obj, dict):
+            if time_s is None:
+                time_obj = obj.get("time")
+                if isinstance(time_obj, dict) and "s" in time_obj:
+                    time_s = (format_path(path + ("time",)), time_obj["s"])
+            # 逆序压栈，保证按原顺序出栈
+            stack.extend((path + (key,), value) for key, value in reversed(list(obj.items())))
+        elif isinstance(obj, list):
+            stack.extend((path + (i,), item) for i, item in reversed(list(enumerate(obj))))
+    return time_fields, time_s
+
+def format_path(path):
+    """将路径元组格式化为 a.b[0].c 形式的字符串"""
+    parts = []
+    for part in path:
+        if isinstance(part, int):
+            parts.append(f"[{part}]")
+        else:
+            parts.append(f".{part}" if parts else part)
+    return "".join(parts)
+
 def analyze_waqi_api():
     """分析WAQI API的返回数据"""
     # 使用测试城市和token（demo token有使用限制）
@@ -28,50 +68,22 @@ def analyze_waqi_api():
         print("API完整返回数据:")
         print(json.dumps(api_response, indent=2, ensure_ascii=False))
         
-        # 查找time相关的字段
+        # 一次遍历同时查找time相关字段和time.s字段
         print("\n" + "=" * 50)
         print("查找time字段:")
         
-        def find_time_fields(obj, path=""):
-            """递归查找包含time的字段"""
-            if isinstance(obj, dict):
-                for key, value in obj.items():
-                    current_path = f"{path}.{key}" if path else key
-                    if "time" in key.lower():
-                        print(f"找到time字段: {current_path} = {value}")
-                    if isinstance(value, (dict, list)):
-                        find_time_fields(value, current_path)
-            elif isinstance(obj, list):
-                for i, item in enumerate(obj):
-                    find_time_fields(item, f"{path}[{i}]")
-        
-        find_time_fields(api_response)
+        time_fields, time_s = find_time_fields(api_response)
+        for current_path, value in time_fields:
+            print(f"找到time字段: {current_path} = {value}")
         
         # 特别查找time.s
         print("\n" + "=" * 30)
         print("查找time.s字段:")
+        time_s_value = None
+        if time_s is not None:
+            time_s_path, time_s_value = time_s
+            print(f"找到time.s: {time_s_path}.s = {time_s_value} (类型: {type(time_s_value)})")
         
-        def find_time_s_field(obj, path=""):
-            """递归查找time.s字段"""
-            if isinstance(obj, dict):
-                if "time" in obj and isinstance(obj["time"], dict) and "s" in obj["time"]:
-                    time_s = obj["time"]["s"]
-                    print(f"找到time.s: {path}.time.s = {time_s} (类型: {type(time_s)})")
-                    return time_s
-                
-                for key, value in obj.items():
-                    current_path = f"{path}.{key}" if path else key
-                    result = find_time_s_field(value, current_path)
-                    if result is not None:
-                        return result
-            elif isinstance(obj, list):
-                for i, item in enumerate(obj):
-                    result = find_time_s_field(item, f"{path}[{i}]")
-                    if result is not None:
-                        return result
-            return None
-        
-        time_s_value = find_time_s_field(api_response)
         if time_s_value:
             print(f"\n成功找到time.s字段，值为: {time_s_value}")
         else:
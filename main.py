@@ -8,20 +8,57 @@
 修复：添加完整的环境变量配置支持
 """
 
-import requests
+import asyncio
+import httpx
 import sqlite3
-import json
-import schedule
+import orjson
+import simdjson
 import time
 import logging
+import logging.handlers
+import queue
 from datetime import datetime
 import sys
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple, Literal
+from dataclasses import dataclass
 import argparse
 from dotenv import load_dotenv
 import os
 import traceback
-from contextlib import contextmanager
+import random
+import collections
+import gzip
+import bisect
+import functools
+from contextlib import contextmanager, closing
+
+
+# 数据验证使用的常量（模块级定义，避免每次验证重复构建）
+_POLLUTANTS = ('pm25', 'pm10', 'co', 'no2', 'o3', 'so2')
+_VALID_LEVELS = frozenset(["优", "良", "轻度污染", "中度污染", "重度污染", "严重污染"])
+
+# AQI等级分界点（含上界）及对应等级
+_AQI_BREAKS = (50, 100, 150, 200, 300)
+_AQI_LEVELS = ("优", "良", "轻度污染", "中度污染", "重度污染", "严重污染")
+
+# 复用的simdjson解析器：只在访问字段时才构造对应的Python对象，
+# 未用到的部分（如forecast.daily）不会被转换。同一时刻只能持有一个文档，
+# 解析结果必须在下一次parse前用完（解析与提取之间没有await，满足此条件）
+_PARSER = simdjson.Parser()
+
+# API请求重试：最多重试3次，退避时间0.5s、1s、2s
+_HTTP_RETRIES = 3
+_HTTP_BACKOFF_FACTOR = 0.5
+_HTTP_RETRY_STATUSES = frozenset([502, 503, 504])
+
+# iaqi中缺少某污染物时共用的空字典，避免每次缺失都分配新字典（只读，勿修改）
+_MISSING = {}
+
+
+@functools.lru_cache(maxsize=512)
+def _aqi_level(aqi_val: int) -> str:
+    """根据整数AQI值查表得到空气质量等级"""
+    return _AQI_LEVELS[bisect.bisect_left(_AQI_BREAKS, aqi_val)]
 
 
 class DatabaseError(Exception):
@@ -34,27 +71,99 @@ class DataValidationError(Exception):
     pass
 
 
+AirQualityLevel = Literal["优", "良", "轻度污染", "中度污染", "重度污染", "严重污染"]
+
+
+@dataclass(slots=True)
+class AirQualityRecord:
+    """一条空气质量记录，构造时完成类型转换和数据验证"""
+    city: str
+    aqi: int
+    pm25: float
+    pm10: float
+    co: float
+    no2: float
+    o3: float
+    so2: float
+    level: AirQualityLevel
+    raw_data: bytes
+
+    def __post_init__(self):
+        """
+        转换数值类型并验证数据（AQI为整数，其余为浮点数，空值按0处理）
+
+        Raises:
+            DataValidationError: 数据无效时抛出
+        """
+        if not isinstance(self.city, str) or not self.city.strip():
+            raise DataValidationError(f"城市名称无效: {self.city}")
+
+        try:
+            self.aqi = int(self.aqi) if self.aqi is not None else 0
+        except (ValueError, TypeError) as e:
+            raise DataValidationError(f"字段 aqi 数值类型错误: {e}")
+        for field in _POLLUTANTS:
+            value = getattr(self, field)
+            try:
+                setattr(self, field, float(value) if value else 0.0)
+            except (ValueError, TypeError) as e:
+                raise DataValidationError(f"字段 {field} 数值类型错误: {e}")
+
+        # 等级由get_air_quality_level从固定集合中生成，此检查只用于发现程序错误，
+        # 以python -O运行时整个检查块会被编译器去掉
+        if __debug__:
+            if self.level not in _VALID_LEVELS:
+                raise DataValidationError(f"空气质量等级无效: {self.level}")
+
+        # 检查压缩后的原始数据大小
+        if len(self.raw_data) >= 200000:
+            raise DataValidationError(f"原始数据过长: {len(self.raw_data)} 字节")
+
+    def as_row(self) -> Tuple:
+        """按_INSERT_SQL的列顺序返回插入数据元组（不含写入时确定的ts_epoch）"""
+        return (self.city, self.aqi, self.pm25, self.pm10, self.co, self.no2, self.o3, self.so2,
+                self.level, self.raw_data)
+
+
 class AirQualityMonitorEnhanced:
     """空气质量监控器（增强版）"""
     
-    def __init__(self, db_path: str = "air_quality.db", api_key: str = None, city: str = "北京", use_city_db: bool = True):
+    # 固定的SQL语句，每次执行使用同一字符串以命中sqlite3的语句缓存
+    _INSERT_SQL = "INSERT INTO air_quality (city, aqi, pm25, pm10, co, no2, o3, so2, level, raw_data, ts_epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+    # 所有实例共享的后台日志线程及其引用计数
+    _log_listener = None
+    _log_queue_handler = None
+    _log_users = 0
+    
+    def __init__(self, db_path: str = "air_quality.db", api_key: str = None, city: str = "北京", use_city_db: bool = True,
+                 cities: Optional[List[str]] = None, log_level: str = "INFO"):
         """
         初始化空气质量监控器
         
+        注意：内部使用httpx.AsyncClient，需在事件循环中创建和使用
+        
         Args:
             db_path: SQLite数据库文件路径
             api_key: 空气质量API密钥
             city: 监控的城市名称
             use_city_db: 是否使用按城市分数据库的存储方式
+            cities: 同时监控的多个城市名称，默认只监控city
+            log_level: 日志级别 (DEBUG, INFO, WARNING, ERROR)
         """
         self.api_key = api_key
-        self.city = city
+        self.cities = list(cities) if cities else [city]
+        self.city = self.cities[0]
         self.use_city_db = use_city_db
         
+        # 多城市数据批量写入同一事务，只能使用统一的数据库文件
+        if len(self.cities) > 1:
+            self.use_city_db = False
+        
         # 根据配置决定数据库路径
-        if use_city_db:
+        if self.use_city_db:
             # 按城市分开存放数据库
-            city_normalized = self.normalize_city_name(city)
+            city_normalized = self.normalize_city_name(self.city)
             self.db_path = f"data/air_quality_{city_normalized}.db"
             
             # 确保data目录存在
@@ -63,24 +172,40 @@ class AirQualityMonitorEnhanced:
             # 使用统一的数据库文件
             self.db_path = db_path
             
-        self.setup_logging()
-
-        # 数据库操作统计
-        self.db_stats = {
-            'total_attempts': 0,
-            'successful_inserts': 0,
-            'failed_inserts': 0,
-            'validation_errors': 0,
-            'last_error': None,
-            'last_error_time': None
-        }
-
-        """如果数据库文件不存在，则创建数据库表"""
-        if not os.path.exists(self.db_path):
-            self.logger.info(f"数据库文件不存在，将创建: {self.db_path}")
-            self.setup_database()
-        else:
-            self.logger.info(f"数据库文件已存在: {self.db_path}")
+        self.setup_logging(log_level)
+        try:
+            if use_city_db and not self.use_city_db:
+                self.logger.warning(f"监控多个城市时不支持按城市分数据库，统一使用: {self.db_path}")
+            self.setup_client()
+
+            # 数据库操作统计
+            self.db_stats = {
+                'total_attempts': 0,
+                'successful_inserts': 0,
+                'failed_inserts': 0,
+                'validation_errors': 0,
+                'last_error': None,
+                'last_error_time': None
+            }
+
+            # 待写入的数据缓冲区，攒批后通过executemany在单个事务中写入
+            self._pending = collections.deque()
+            self._flush_threshold = 32
+
+            """如果数据库文件不存在，则创建数据库表"""
+            if not os.path.exists(self.db_path):
+                self.logger.info(f"数据库文件不存在，将创建: {self.db_path}")
+                self.setup_database()
+            else:
+                self.logger.info(f"数据库文件已存在: {self.db_path}")
+                self.upgrade_schema()
+        
+            # 长连接：避免每次写入重新打开数据库，并保持页缓存常驻
+            self._conn = self._connect()
+        except BaseException:
+            # 初始化失败时不会有调用方执行close()，在此停止后台日志线程，确保已入队的日志写出
+            self._stop_logging()
+            raise
             
     def normalize_city_name(self, city: str) -> str:
         """
@@ -101,22 +226,74 @@ class AirQualityMonitorEnhanced:
         # 转换为小写
         return city_normalized.lower()
             
-    def setup_logging(self):
-        """设置日志记录"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('air_quality_enhanced.log', encoding='utf-8'),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+    def setup_logging(self, log_level: str = "INFO"):
+        """设置日志记录（日志先进入队列，由后台线程写入文件和控制台，不阻塞收集流程）"""
+        cls = AirQualityMonitorEnhanced
+        # 多个监控实例共享同一个队列和后台线程，避免重复打开日志文件
+        if cls._log_listener is None:
+            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+            file_handler = logging.FileHandler('air_quality_enhanced.log', encoding='utf-8')
+            file_handler.setFormatter(formatter)
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(formatter)
+
+            log_queue = queue.Queue(-1)
+            cls._log_queue_handler = logging.handlers.QueueHandler(log_queue)
+            # 入队时只合并消息参数，时间和级别由后台handler的formatter输出
+            cls._log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+            logging.getLogger().addHandler(cls._log_queue_handler)
+            cls._log_listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+            cls._log_listener.start()
+        cls._log_users += 1
+        self._logging_active = True
+        logging.getLogger().setLevel(getattr(logging, log_level.upper(), logging.INFO))
+        # httpx在INFO级别记录完整请求URL（含token参数），避免API密钥写入日志
+        for name in ("httpx", "httpcore"):
+            logging.getLogger(name).setLevel(logging.WARNING)
         self.logger = logging.getLogger(__name__)
+
+    def _stop_logging(self):
+        """释放本实例对后台日志线程的引用，最后一个实例释放时停止线程并关闭日志文件"""
+        if not self._logging_active:
+            return
+        self._logging_active = False
+        cls = AirQualityMonitorEnhanced
+        cls._log_users -= 1
+        if cls._log_users == 0:
+            logging.getLogger().removeHandler(cls._log_queue_handler)
+            # stop()会先写完队列中剩余的日志
+            cls._log_listener.stop()
+            for handler in cls._log_listener.handlers:
+                handler.close()
+            cls._log_listener = None
+            cls._log_queue_handler = None
+        
+    def setup_client(self):
+        """创建复用连接的异步HTTP客户端（HTTP/2多路复用，多个城市共享同一连接）"""
+        # 不传入自定义transport，以保留对HTTP(S)_PROXY等环境变量代理的支持；
+        # 重试由_get_with_retry处理
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=8),
+            timeout=15.0,
+            headers={
+                "User-Agent": "AirQualityMonitorEnhanced/1.0",
+                "Accept-Encoding": "gzip"
+            }
+        )
+        
+    async def close(self):
+        """写入缓冲区中剩余的数据，释放HTTP客户端并停止后台日志线程"""
+        if self._pending:
+            await self._flush()
+        self._conn.close()
+        await self.client.aclose()
+        self._stop_logging()
         
     def setup_database(self):
         """创建数据库表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with closing(sqlite3.connect(self.db_path)) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS air_quality (
@@ -132,7 +309,8 @@ class AirQualityMonitorEnhanced:
                         so2 REAL,
                         level TEXT,
                         source TEXT DEFAULT 'waqi',
-                        raw_data TEXT
+                        raw_data BLOB,
+                        ts_epoch INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
                     )
                 ''')
                 conn.commit()
@@ -140,274 +318,330 @@ class AirQualityMonitorEnhanced:
         except Exception as e:
             self.logger.error(f"数据库设置失败: {e}")
             raise DatabaseError(f"数据库设置失败: {e}")
+        self.upgrade_schema()
             
-    @contextmanager
-    def get_db_connection(self):
-        """获取数据库连接的上下文管理器"""
-        conn = None
+    def upgrade_schema(self):
+        """开启WAL、补齐旧数据库缺少的列并创建查询索引（新建和已存在的数据库都会执行）"""
         try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            conn.row_factory = sqlite3.Row
-            yield conn
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                cursor = conn.cursor()
+                # WAL模式持久保存在数据库文件中，提交时只需追加写日志；
+                # 连接级的synchronous=NORMAL只有在WAL模式下才不降低持久性。
+                # 切换日志模式不能在事务中进行，因此放在所有写操作之前
+                journal_mode = cursor.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+                if journal_mode.lower() != "wal":
+                    self.logger.warning(f"无法开启WAL模式，当前日志模式: {journal_mode}")
+                # ts_epoch：整数秒时间戳，按时间比较时比TEXT类型的timestamp更快
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(air_quality)")}
+                if "ts_epoch" not in columns:
+                    # ALTER TABLE不支持非常量默认值，新数据由程序写入，旧数据从timestamp回填
+                    cursor.execute("ALTER TABLE air_quality ADD COLUMN ts_epoch INTEGER")
+                    cursor.execute(
+                        "UPDATE air_quality SET ts_epoch = CAST(strftime('%s', timestamp) AS INTEGER)"
+                    )
+                    self.logger.info("已为旧数据库添加ts_epoch列")
+                # 按城市查询最近数据时走索引范围扫描，避免全表扫描
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_air_quality_city_ts ON air_quality(city, timestamp DESC)"
+                )
+                # 按城市和整数时间戳的范围查询
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_air_quality_city_epoch ON air_quality(city, ts_epoch)"
+                )
+                # 按时间范围的统计分析查询
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_air_quality_ts ON air_quality(timestamp)"
+                )
+                conn.commit()
+        except Exception as e:
+            self.logger.error(f"数据库索引创建失败: {e}")
+            raise DatabaseError(f"数据库索引创建失败: {e}")
+            
+    def _connect(self) -> sqlite3.Connection:
+        """
+        打开数据库连接并应用连接级PRAGMA
+        
+        Returns:
+            数据库连接（isolation_level=None，由调用方显式BEGIN/COMMIT）
+        """
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            # 以下PRAGMA仅对当前连接生效，长连接只需设置一次
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-20000")
+            return conn
         except sqlite3.Error as e:
             self.logger.error(f"数据库连接错误: {e}")
-            if conn:
-                conn.rollback()
             raise DatabaseError(f"数据库连接错误: {e}")
-        finally:
-            if conn:
-                conn.close()
     
-    def validate_data(self, data: Dict) -> bool:
+    def _reopen(self):
+        """重新打开长连接（连接出现OperationalError或已关闭后调用）"""
+        # 先建立新连接，成功后再替换并关闭旧连接；新连接失败时保留旧连接，下次重试时再尝试
+        conn = self._connect()
+        old_conn, self._conn = self._conn, conn
+        try:
+            old_conn.close()
+        except sqlite3.Error:
+            pass
+        self.logger.info("数据库连接已重新打开")
+    
+    @contextmanager
+    def _transaction(self):
+        """在长连接上开启写事务，正常结束时提交，出错时回滚"""
+        conn = self._conn
+        # 立即获取写锁，锁冲突在事务开始时暴露（由timeout等待），而不是在提交时失败
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            raise
+    
+    async def save_to_database(self, record: AirQualityRecord, retry_count: int = 3) -> bool:
         """
-        验证数据完整性和类型
-        
+        将空气质量记录加入写入缓冲区，缓冲区满时批量写入数据库（增强版）
+
         Args:
-            data: 要验证的数据
-            
+            record: 已在构造时完成验证的空气质量记录
+            retry_count: 批量写入时的重试次数
+
         Returns:
-            验证通过返回True，失败返回False
+            已缓冲（或写入成功）返回True，失败返回False
         """
-        try:
-            # 检查必填字段
-            required_fields = ['city', 'aqi', 'pm25', 'pm10', 'co', 'no2', 'o3', 'so2', 'level', 'raw_data']
-            for field in required_fields:
-                if field not in data:
-                    self.logger.error(f"缺少必填字段: {field}")
-                    raise DataValidationError(f"缺少必填字段: {field}")
-            
-            # 验证数据类型
-            if not isinstance(data['city'], str) or not data['city'].strip():
-                self.logger.error(f"城市名称无效: {data['city']}")
-                raise DataValidationError(f"城市名称无效: {data['city']}")
-            
-            # 验证数值字段
-            numeric_fields = ['aqi', 'pm25', 'pm10', 'co', 'no2', 'o3', 'so2']
-            for field in numeric_fields:
-                try:
-                    value = float(data[field]) if data[field] is not None else 0.0
-                    if field == 'aqi' and not isinstance(data[field], int) and not float(data[field]).is_integer():
-                        # AQI应该是整数
-                        pass  # SQLite会自动转换
-                except (ValueError, TypeError) as e:
-                    self.logger.error(f"字段 {field} 数值类型错误: {data[field]}, 错误: {e}")
-                    raise DataValidationError(f"字段 {field} 数值类型错误: {e}")
-            
-            # 验证等级字段
-            valid_levels = ["优", "良", "轻度污染", "中度污染", "重度污染", "严重污染"]
-            if data['level'] not in valid_levels:
-                self.logger.error(f"空气质量等级无效: {data['level']}")
-                raise DataValidationError(f"空气质量等级无效: {data['level']}")
-            
-            # 检查字符串长度（避免SQLite TEXT限制问题）
-            if len(data['raw_data']) > 1000000:  # 1MB限制
-                self.logger.error(f"原始数据过长: {len(data['raw_data'])} 字符")
-                raise DataValidationError(f"原始数据过长: {len(data['raw_data'])} 字符")
-            
-            return True
-            
-        except DataValidationError:
-            raise
-        except Exception as e:
-            self.logger.error(f"数据验证过程中发生未知错误: {e}")
-            raise DataValidationError(f"数据验证过程中发生未知错误: {e}")
-            
-    def save_to_database(self, data: Dict, retry_count: int = 3) -> bool:
+        self._pending.append((*record.as_row(), int(time.time())))
+
+        if len(self._pending) >= self._flush_threshold:
+            return await self._flush(retry_count)
+        return True
+
+    async def _flush(self, retry_count: int = 3) -> bool:
         """
-        将空气质量数据保存到数据库（增强版）
-        
+        在单个事务中批量写入缓冲区中的数据
+
         Args:
-            data: 空气质量数据
             retry_count: 重试次数
-            
+
         Returns:
-            保存成功返回True，失败返回False
+            写入成功（或缓冲区为空）返回True，失败返回False
         """
-        self.db_stats['total_attempts'] += 1
-        
+        if not self._pending:
+            return True
+
+        rows = list(self._pending)
+        self._pending.clear()
+
         for attempt in range(retry_count):
             try:
-                # 验证数据
-                self.logger.debug(f"开始验证数据，尝试 {attempt + 1}/{retry_count}")
-                self.validate_data(data)
-                
-                # 准备插入数据
-                insert_data = (
-                    data["city"], 
-                    int(data["aqi"]),  # 确保aqi是整数
-                    float(data["pm25"]) if data["pm25"] else 0.0,
-                    float(data["pm10"]) if data["pm10"] else 0.0,
-                    float(data["co"]) if data["co"] else 0.0,
-                    float(data["no2"]) if data["no2"] else 0.0,
-                    float(data["o3"]) if data["o3"] else 0.0,
-                    float(data["so2"]) if data["so2"] else 0.0,
-                    data["level"], 
-                    data["raw_data"][:990000]  # 确保不超过SQLite限制
-                )
-                
-                # 执行插入
-                with self.get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    
-                    # 插入数据
-                    cursor.execute('''
-                        INSERT INTO air_quality 
-                        (city, aqi, pm25, pm10, co, no2, o3, so2, level, raw_data)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', insert_data)
-                    
+                with self._transaction() as conn:
+                    cursor = conn.executemany(self._INSERT_SQL, rows)
+
                     # 验证插入是否成功
-                    rows_affected = cursor.rowcount
-                    if rows_affected == 0:
-                        raise DatabaseError("插入操作未影响任何行")
-                    
-                    conn.commit()
-                    
-                    # 验证数据确实已插入
-                    cursor.execute("SELECT COUNT(*) FROM air_quality WHERE city = ? AND aqi = ? AND timestamp > datetime('now', '-5 minutes')", 
-                                 (data["city"], int(data["aqi"])))
-                    count = cursor.fetchone()[0]
-                    
-                    if count == 0:
-                        raise DatabaseError("数据插入后验证失败，数据未找到")
-                    
-                    self.logger.info(f"数据保存成功 - {data['city']}: AQI {data['aqi']} ({data['level']}) [尝试 {attempt + 1}]")
-                    self.db_stats['successful_inserts'] += 1
-                    return True
-                    
-            except DataValidationError as e:
-                self.db_stats['validation_errors'] += 1
-                self.logger.error(f"数据验证失败: {e}")
-                return False
-                
+                    if cursor.rowcount != len(rows):
+                        raise DatabaseError(f"插入行数不符: 期望 {len(rows)}，实际 {cursor.rowcount}")
+
+                self.logger.info(f"数据保存成功 - 共 {len(rows)} 条 [尝试 {attempt + 1}]")
+                self.db_stats['successful_inserts'] += len(rows)
+                return True
+
             except DatabaseError as e:
                 self.logger.warning(f"数据库操作失败 [尝试 {attempt + 1}/{retry_count}]: {e}")
                 if attempt == retry_count - 1:  # 最后一次尝试
-                    self.db_stats['failed_inserts'] += 1
+                    self.db_stats['failed_inserts'] += len(rows)
                     self.db_stats['last_error'] = str(e)
-                    self.db_stats['last_error_time'] = datetime.now().isoformat()
+                    self.db_stats['last_error_time'] = time.strftime("%Y-%m-%dT%H:%M:%S")
                     self.logger.error(f"数据库保存最终失败: {e}")
                     return False
-                time.sleep(1)  # 等待1秒后重试
-                
+                await asyncio.sleep(1)  # 等待1秒后重试，不阻塞事件循环
+
+            except (sqlite3.OperationalError, sqlite3.ProgrammingError) as e:
+                # ProgrammingError：连接已被关闭（Cannot operate on a closed database）
+                self.logger.error(f"SQLite错误 [尝试 {attempt + 1}/{retry_count}]: {e}")
+                if attempt == retry_count - 1:
+                    self.db_stats['failed_inserts'] += len(rows)
+                    self.db_stats['last_error'] = f"SQLite错误: {e}"
+                    self.db_stats['last_error_time'] = time.strftime("%Y-%m-%dT%H:%M:%S")
+                    return False
+                await asyncio.sleep(1)
+                # 连接可能已失效，重新打开后重试
+                try:
+                    self._reopen()
+                except DatabaseError:
+                    pass
+
             except sqlite3.Error as e:
                 self.logger.error(f"SQLite错误 [尝试 {attempt + 1}/{retry_count}]: {e}")
                 if attempt == retry_count - 1:
-                    self.db_stats['failed_inserts'] += 1
+                    self.db_stats['failed_inserts'] += len(rows)
                     self.db_stats['last_error'] = f"SQLite错误: {e}"
-                    self.db_stats['last_error_time'] = datetime.now().isoformat()
+                    self.db_stats['last_error_time'] = time.strftime("%Y-%m-%dT%H:%M:%S")
                     return False
-                time.sleep(1)
-                
+                await asyncio.sleep(1)
+
             except Exception as e:
                 self.logger.error(f"未知错误 [尝试 {attempt + 1}/{retry_count}]: {e}")
-                self.logger.error(f"错误详情: {traceback.format_exc()}")
+                # format_exc需要遍历并格式化调用栈，仅在DEBUG级别时输出
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.error(f"错误详情: {traceback.format_exc()}")
                 if attempt == retry_count - 1:
-                    self.db_stats['failed_inserts'] += 1
+                    self.db_stats['failed_inserts'] += len(rows)
                     self.db_stats['last_error'] = f"未知错误: {e}"
-                    self.db_stats['last_error_time'] = datetime.now().isoformat()
+                    self.db_stats['last_error_time'] = time.strftime("%Y-%m-%dT%H:%M:%S")
                     return False
-                time.sleep(1)
-        
+                await asyncio.sleep(1)
+
         return False
-            
-    def collect_once(self) -> bool:
+
+    async def collect_once(self) -> bool:
         """
         执行一次数据收集（增强版）
-        
+
+        所有城市的请求并发发出，共享同一HTTP/2连接，结果在单个事务中批量写入
+
         Returns:
-            收集成功返回True，失败返回False
+            所有城市均收集成功返回True，否则返回False
         """
-        self.logger.info(f"开始收集 {self.city} 的空气质量数据...")
-        
+        self.logger.info(f"开始收集 {', '.join(self.cities)} 的空气质量数据...")
+
         try:
-            # 获取API数据
-            data = self.fetch_data_from_api()
-            if not data:
-                self.logger.error("数据获取失败")
+            # 并发获取所有城市的API数据
+            results = await self.collect_batch()
+
+            success = True
+            for city, data in zip(self.cities, results):
+                if not data:
+                    self.logger.error(f"数据获取失败 - {city}")
+                    success = False
+                    continue
+
+                # 记录要保存的数据摘要
+                self.logger.debug(f"准备保存数据: 城市={data.city}, AQI={data.aqi}, 等级={data.level}")
+
+                # 加入写入缓冲区
+                if not await self.save_to_database(data):
+                    self.logger.error(f"数据保存失败 - {data.city}: AQI {data.aqi} ({data.level})")
+                    success = False
+
+            # 本轮收集结束时写入缓冲区
+            if not await self._flush():
                 return False
-            
-            # 记录要保存的数据摘要
-            self.logger.debug(f"准备保存数据: 城市={data['city']}, AQI={data['aqi']}, 等级={data['level']}")
-            
-            # 保存到数据库
-            success = self.save_to_database(data)
-            
+
             if success:
-                self.logger.info(f"数据收集和保存完成 - {data['city']}: AQI {data['aqi']} ({data['level']})")
-                return True
-            else:
-                self.logger.error(f"数据保存失败 - {data['city']}: AQI {data['aqi']} ({data['level']})")
-                return False
-                
+                self.logger.info(f"数据收集和保存完成 - 共 {len(self.cities)} 个城市")
+            return success
+
         except Exception as e:
             self.logger.error(f"数据收集过程中发生异常: {e}")
-            self.logger.error(f"异常详情: {traceback.format_exc()}")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.error(f"异常详情: {traceback.format_exc()}")
             return False
+
+    async def collect_batch(self) -> List[Optional[AirQualityRecord]]:
+        """
+        并发获取所有监控城市的数据
+
+        Returns:
+            与self.cities顺序一致的数据列表，获取失败的城市为None
+        """
+        return await asyncio.gather(*[self.fetch_data_from_api(city) for city in self.cities])
+
+    async def _get_with_retry(self, url: str, params: Dict) -> httpx.Response:
+        """
+        发送GET请求，连接错误或502/503/504时按指数退避重试
+        
+        Args:
+            url: 请求URL
+            params: 查询参数
             
-    def fetch_data_from_api(self, city: str = None) -> Optional[Dict]:
+        Returns:
+            最后一次请求的响应
+        """
+        for attempt in range(_HTTP_RETRIES + 1):
+            try:
+                response = await self.client.get(url, params=params)
+            except httpx.TransportError as e:
+                if attempt == _HTTP_RETRIES:
+                    raise
+                self.logger.warning(f"API请求失败，准备重试 [{attempt + 1}/{_HTTP_RETRIES}]: {e}")
+            else:
+                if response.status_code not in _HTTP_RETRY_STATUSES or attempt == _HTTP_RETRIES:
+                    return response
+                self.logger.warning(f"API返回 {response.status_code}，准备重试 [{attempt + 1}/{_HTTP_RETRIES}]")
+            await asyncio.sleep(_HTTP_BACKOFF_FACTOR * (2 ** attempt))
+            
+    async def fetch_data_from_api(self, city: str = None) -> Optional[AirQualityRecord]:
         """
         从WAQI空气质量API获取数据（增强版）
-        
+
         Args:
             city: 城市名称，默认为初始化时设置的城市
-            
+
         Returns:
-            包含空气质量数据的字典，失败返回None
+            空气质量记录，失败返回None
         """
         city = city or self.city
-        
+
         # 使用WAQI API: https://api.waqi.info/feed/{city}/?token={api_key}
         try:
             if self.api_key:
                 # 构建API URL
                 url = f"https://api.waqi.info/feed/{city}/"
                 params = {"token": self.api_key}
-                headers = {
-                    "User-Agent": "AirQualityMonitorEnhanced/1.0"
-                }
-                
+
                 self.logger.info(f"正在请求WAQI API: {url}")
-                response = requests.get(url, params=params, headers=headers, timeout=15)
+                response = await self._get_with_retry(url, params)
                 response.raise_for_status()
-                
-                api_response = response.json()
-                
+
+                # 非法JSON时simdjson抛出ValueError；其他异常（如RuntimeError）不属于解析失败
+                try:
+                    api_response = _PARSER.parse(response.content)
+                except ValueError as e:
+                    self.logger.error(f"JSON解析失败: {e}")
+                    return None
+
                 # 检查API返回状态
                 if api_response.get("status") != "ok":
                     error_msg = api_response.get("data", "Unknown error")
+                    # data为对象或数组时转换为Python对象后再输出
+                    if isinstance(error_msg, simdjson.Object):
+                        error_msg = error_msg.as_dict()
+                    elif isinstance(error_msg, simdjson.Array):
+                        error_msg = error_msg.as_list()
                     self.logger.error(f"API返回错误: {error_msg}")
                     return None
-                
+
                 # 解析API返回的数据
-                parsed_data = self.parse_waqi_response(api_response, city)
+                parsed_data = self.parse_waqi_response(api_response, city, response.content)
                 return parsed_data
-                
+
             else:
                 # 模拟数据（用于测试和演示）
                 self.logger.warning("未设置API密钥，使用模拟数据")
                 return self.generate_mock_data(city)
-                
-        except requests.exceptions.RequestException as e:
+
+        except httpx.HTTPError as e:
             self.logger.error(f"API请求失败: {e}")
             return None
-        except json.JSONDecodeError as e:
-            self.logger.error(f"JSON解析失败: {e}")
-            return None
         except Exception as e:
             self.logger.error(f"数据获取异常: {e}")
             return None
             
-    def parse_waqi_response(self, api_response: Dict, city: str) -> Optional[Dict]:
+    def parse_waqi_response(self, api_response: simdjson.Object, city: str, response_bytes: bytes) -> Optional[AirQualityRecord]:
         """
         解析WAQI API返回的数据（增强版）
         
         Args:
-            api_response: WAQI API返回的原始数据
+            api_response: WAQI API返回的原始数据（simdjson文档对象，按需取值）
             city: 城市名称
+            response_bytes: API返回的原始响应字节，gzip压缩后存入raw_data
             
         Returns:
-            解析后的数据字典
+            解析并验证后的空气质量记录，失败返回None
         """
         try:
             data = api_response.get("data", {})
@@ -419,29 +653,25 @@ class AirQualityMonitorEnhanced:
             # 提取iaqi数据（各污染物的值）
             iaqi = data.get("iaqi", {})
             
-            # 从iaqi中提取各污染物的值
-            pm25 = self._extract_iaqi_value(iaqi, "pm25")
-            pm10 = self._extract_iaqi_value(iaqi, "pm10")
-            co = self._extract_iaqi_value(iaqi, "co")
-            no2 = self._extract_iaqi_value(iaqi, "no2")
-            o3 = self._extract_iaqi_value(iaqi, "o3")
-            so2 = self._extract_iaqi_value(iaqi, "so2")
-            
-            # 构建解析后的数据
-            parsed_data = {
-                "city": city_name,
-                "aqi": aqi,
-                "pm25": pm25,
-                "pm10": pm10,
-                "co": co,
-                "no2": no2,
-                "o3": o3,
-                "so2": so2,
-                "level": self.get_air_quality_level(aqi),
-                "raw_data": json.dumps(api_response, ensure_ascii=False, indent=2)
-            }
-            
-            self.logger.info(f"数据解析成功 - {city_name}: AQI {aqi} ({parsed_data['level']})")
+            # 从iaqi中提取各污染物的值；有非法值时逐个提取，非法值按0.0处理
+            try:
+                pollutants = {p: float(iaqi.get(p, _MISSING).get("v", 0.0) or 0.0) for p in _POLLUTANTS}
+            except (ValueError, TypeError):
+                pollutants = {p: self._extract_iaqi_value(iaqi, p) for p in _POLLUTANTS}
+            
+            # 构建解析后的记录（构造时完成验证）
+            parsed_data = self._build_record(
+                city=city_name,
+                aqi=aqi,
+                **pollutants,
+                level=self.get_air_quality_level(aqi),
+                # 压缩级别1速度约为默认级别的3倍，压缩率接近
+                raw_data=gzip.compress(response_bytes, compresslevel=1)
+            )
+            if parsed_data is None:
+                return None
+            
+            self.logger.info(f"数据解析成功 - {city_name}: AQI {parsed_data.aqi} ({parsed_data.level})")
             return parsed_data
             
         except Exception as e:
@@ -460,13 +690,33 @@ class AirQualityMonitorEnhanced:
             污染物值，如果不存在则返回0.0
         """
         try:
-            value = iaqi.get(pollutant, {}).get("v", 0.0)
+            value = iaqi.get(pollutant, _MISSING).get("v", 0.0)
             return float(value) if value is not None else 0.0
         except (ValueError, TypeError) as e:
             self.logger.warning(f"无法提取污染物 {pollutant} 的值，使用默认值: {e}")
             return 0.0
         
-    def generate_mock_data(self, city: str) -> Dict:
+    def _build_record(self, **fields) -> Optional[AirQualityRecord]:
+        """
+        构造并验证空气质量记录，同时计入操作统计
+        
+        每次构造都计为一次尝试，验证失败计入validation_errors
+        
+        Args:
+            fields: AirQualityRecord的字段
+            
+        Returns:
+            验证通过的记录，失败返回None
+        """
+        self.db_stats['total_attempts'] += 1
+        try:
+            return AirQualityRecord(**fields)
+        except DataValidationError as e:
+            self.db_stats['validation_errors'] += 1
+            self.logger.error(f"数据验证失败: {e}")
+            return None
+        
+    def generate_mock_data(self, city: str) -> Optional[AirQualityRecord]:
         """
         生成模拟空气质量数据（增强版）
         
@@ -474,23 +724,24 @@ class AirQualityMonitorEnhanced:
             city: 城市名称
             
         Returns:
-            模拟的空气质量数据
+            模拟的空气质量记录，验证失败返回None
         """
-        import random
-        
         aqi = random.randint(50, 200)
-        return {
-            "city": city,
-            "aqi": aqi,
-            "pm25": round(random.uniform(10, 150), 2),
-            "pm10": round(random.uniform(20, 200), 2),
-            "co": round(random.uniform(0.5, 3.0), 2),
-            "no2": round(random.uniform(10, 100), 2),
-            "o3": round(random.uniform(20, 200), 2),
-            "so2": round(random.uniform(5, 50), 2),
-            "level": self.get_air_quality_level(aqi),
-            "raw_data": json.dumps({"mock": True, "generated_at": datetime.now().isoformat()})
-        }
+        return self._build_record(
+            city=city,
+            aqi=aqi,
+            pm25=round(random.uniform(10, 150), 2),
+            pm10=round(random.uniform(20, 200), 2),
+            co=round(random.uniform(0.5, 3.0), 2),
+            no2=round(random.uniform(10, 100), 2),
+            o3=round(random.uniform(20, 200), 2),
+            so2=round(random.uniform(5, 50), 2),
+            level=self.get_air_quality_level(aqi),
+            raw_data=gzip.compress(
+                orjson.dumps({"mock": True, "generated_at": datetime.now().isoformat()}),
+                compresslevel=1
+            )
+        )
         
     def get_air_quality_level(self, aqi: int) -> str:
         """
@@ -507,18 +758,7 @@ class AirQualityMonitorEnhanced:
         except (ValueError, TypeError):
             aqi_val = 0
             
-        if aqi_val <= 50:
-            return "优"
-        elif aqi_val <= 100:
-            return "良"
-        elif aqi_val <= 150:
-            return "轻度污染"
-        elif aqi_val <= 200:
-            return "中度污染"
-        elif aqi_val <= 300:
-            return "重度污染"
-        else:
-            return "严重污染"
+        return _aqi_level(aqi_val)
             
     def get_database_statistics(self) -> Dict:
         """
@@ -543,7 +783,7 @@ class AirQualityMonitorEnhanced:
             print(f"错误时间: {stats['last_error_time']}")
         print("========================\n")
             
-    def start_monitoring(self, interval_hours: int = 1):
+    async def start_monitoring(self, interval_hours: int = 1):
         """
         开始定时监控（增强版）
         
@@ -552,16 +792,14 @@ class AirQualityMonitorEnhanced:
         """
         self.logger.info(f"开始定时监控，每 {interval_hours} 小时收集一次数据")
         
-        # 设置定时任务
-        schedule.every(interval_hours).hours.do(self.collect_once)
-        
-        # 立即执行一次
-        self.collect_once()
-        
-        # 开始调度循环
+        # 立即执行一次，之后按固定节拍循环；以单调时钟计算下次触发时间，
+        # 收集耗时不会累积成漂移，两次收集之间进程只唤醒一次
+        interval = interval_hours * 3600
+        next_fire = time.monotonic()
         while True:
-            schedule.run_pending()
-            time.sleep(60)  # 每分钟检查一次
+            await self.collect_once()
+            next_fire += interval
+            await asyncio.sleep(max(0.0, next_fire - time.monotonic()))
 
 
 def load_config():
@@ -581,6 +819,9 @@ def load_config():
     # 城市名称 - 从环境变量AQ_CITY获取，默认为北京
     city = os.getenv('AQ_CITY', '北京')
     
+    # 多城市 - 从环境变量AQ_CITIES获取（逗号分隔），设置后覆盖AQ_CITY
+    cities = [c.strip() for c in os.getenv('AQ_CITIES', '').split(',') if c.strip()]
+    
     # 监控间隔 - 从环境变量AQ_INTERVAL获取，默认为1小时
     interval = int(os.getenv('AQ_INTERVAL', '1'))
     
@@ -594,6 +835,7 @@ def load_config():
         'api_key': api_key,
         'db_path': db_path,
         'city': city,
+        'cities': cities,
         'interval': interval,
         'log_level': log_level,
         'use_city_db': use_city_db
@@ -605,14 +847,16 @@ def main():
     # 首先加载环境变量配置
     config = load_config()
     
-    # 设置日志级别
-    logging.getLogger().setLevel(getattr(logging, config['log_level']))
-    
     parser = argparse.ArgumentParser(description='空气质量自动化监控程序（增强版）')
     parser.add_argument('--city', default=config['city'], help='监控的城市名称')
+    parser.add_argument('--cities', nargs='+', default=config['cities'],
+                       help='同时监控的多个城市名称（设置后覆盖--city）')
     parser.add_argument('--api-key', default=config['api_key'], help='WAQI API密钥')
     parser.add_argument('--db-path', default=config['db_path'], help='数据库文件路径')
     parser.add_argument('--interval', type=int, default=config['interval'], help='监控间隔（小时）')
+    parser.add_argument('--log-level', default=config['log_level'],
+                       choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper,
+                       help='日志级别')
     parser.add_argument('--mode', choices=['monitor', 'once', 'test'], 
                        default='test', help='运行模式')
     parser.add_argument('--use-city-db', action='store_true', default=config['use_city_db'], 
@@ -622,41 +866,53 @@ def main():
     
     args = parser.parse_args()
     
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n程序被用户中断")
+
+
+async def run(args):
+    """在事件循环中按运行模式执行监控"""
+    monitor = None
     try:
         # 创建监控器实例
         monitor = AirQualityMonitorEnhanced(
             db_path=args.db_path,
             api_key=args.api_key,
             city=args.city,
-            use_city_db=args.use_city_db
+            use_city_db=args.use_city_db,
+            cities=args.cities,
+            log_level=args.log_level
         )
         
         if args.mode == 'test':
             # 测试模式：运行3次收集操作来验证错误处理
             print("=== 测试模式：验证改进的错误处理机制 ===")
-            print(f"使用配置: 城市={args.city}, 数据库={args.db_path}")
+            print(f"使用配置: 城市={', '.join(monitor.cities)}, 数据库={monitor.db_path}")
             for i in range(3):
                 print(f"\n--- 测试轮次 {i+1} ---")
-                success = monitor.collect_once()
+                success = await monitor.collect_once()
                 print(f"收集结果: {'成功' if success else '失败'}")
                 monitor.print_database_statistics()
-                time.sleep(2)  # 间隔2秒
+                await asyncio.sleep(2)  # 间隔2秒
                 
         elif args.mode == 'monitor':
             # 定时监控模式
-            monitor.start_monitoring(args.interval)
+            await monitor.start_monitoring(args.interval)
             
         elif args.mode == 'once':
             # 单次收集模式
-            success = monitor.collect_once()
+            success = await monitor.collect_once()
             print("数据收集" + ("成功" if success else "失败"))
             monitor.print_database_statistics()
                 
-    except KeyboardInterrupt:
-        print("\n程序被用户中断")
     except Exception as e:
         print(f"程序异常: {e}")
         logging.error(f"程序异常: {e}")
+    finally:
+        if monitor:
+            await monitor.close()
 
 
 if __name__ == "__main__":
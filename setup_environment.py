@@ -12,7 +12,7 @@ import os
 def check_python_version():
     """检查Python版本"""
     print(f"当前Python版本: {sys.version}")
-    return sys.version_info >= (3, 6)
+    return sys.version_info >= (3, 10)
 
 def check_virtual_env():
     """检查虚拟环境状态"""
@@ -147,7 +147,7 @@ def main():
     
     # 检查Python版本
     if not check_python_version():
-        print("✗ Python版本过低，需要3.6+")
+        print("✗ Python版本过低，需要3.10+")
         return
     
     # 检查虚拟环境